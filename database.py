@@ -1,12 +1,44 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    create_engine,
+    event,
+    Column,
+    Index,
+    Integer,
+    String,
+    Text,
+    DateTime,
+)
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from datetime import datetime
 
 DATABASE_URL = "sqlite:///./analysis.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits, and NORMAL fsync
+    # is far cheaper per commit while still safe under WAL.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(bind=engine)
 
+# Thread-local session for long-lived processes (Celery workers): reuse
+# the connection across tasks and call Session.remove() per task instead
+# of opening and closing a session every time.
+Session = scoped_session(SessionLocal)
+
 Base = declarative_base()
 
 
@@ -19,6 +51,9 @@ class AnalysisResult(Base):
     result = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Supports the dedupe lookup in /analyze
+    __table_args__ = (Index("ix_analysis_filename_query", "filename", "query"),)
+
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
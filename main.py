@@ -1,8 +1,13 @@
+import hashlib
+import json
 import os
 import uuid
+from multiprocessing import shared_memory
+
+import aiofiles
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
 # Load env
@@ -11,13 +16,18 @@ load_dotenv(override=True)
 # Crew / worker imports
 from celery_app import celery_app
 from celery.result import AsyncResult
-from worker import process_document
-from database import init_db
+from worker import process_document, redis_client
+from database import init_db, SessionLocal, AnalysisResult
 
 # =========================
 # App setup
 # =========================
-app = FastAPI(title="Financial Document Analyzer")
+# orjson serializes large markdown result strings 2-5x faster than
+# the stdlib encoder used by the default JSONResponse.
+app = FastAPI(
+    title="Financial Document Analyzer",
+    default_response_class=ORJSONResponse,
+)
 
 UPLOAD_DIR = "data"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -29,17 +39,81 @@ init_db()
 # =========================
 # Helper: save uploaded file
 # =========================
-async def save_upload_file(upload_file: UploadFile) -> str:
+CHUNK_SIZE = 1 << 20  # 1MB
+
+# Modest uploads are handed to the worker through shared memory so it
+# never re-reads the PDF from disk; larger files fall back to the path.
+SHM_MAX_BYTES = 32 << 20
+
+
+def _share_upload_bytes(buffered: bytearray):
+    """Put the upload bytes in shared memory; returns (name, size).
+
+    Best-effort: any failure just means the worker reads from disk.
+    """
     try:
-        file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(upload_file.filename)[1]
-        file_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_extension}")
+        shm = shared_memory.SharedMemory(create=True, size=len(buffered))
+        shm.buf[: len(buffered)] = buffered
+        name = shm.name
+        shm.close()
+        return name, len(buffered)
+    except Exception:
+        return None, 0
+
+
+def _discard_shared_bytes(shm_name):
+    if shm_name is None:
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shm.close()
+        shm.unlink()
+    except Exception:
+        pass
 
-        contents = await upload_file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
 
-        return file_path
+async def save_upload_file(upload_file: UploadFile):
+    try:
+        file_extension = os.path.splitext(upload_file.filename)[1]
+        tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.tmp")
+
+        # Stream in 1MB chunks: memory stays bounded by the chunk size
+        # instead of the whole upload, and writes never block the loop.
+        # Hash while streaming so the file is named by its content and
+        # re-uploads of the same document land on the same path. Small
+        # files also keep an in-memory copy for the shared-memory handoff.
+        hasher = hashlib.sha256()
+        buffered = bytearray()
+        keep_copy = True
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                while chunk := await upload_file.read(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    await f.write(chunk)
+                    if keep_copy:
+                        buffered += chunk
+                        if len(buffered) > SHM_MAX_BYTES:
+                            keep_copy = False
+                            buffered = bytearray()
+
+            file_path = os.path.join(
+                UPLOAD_DIR, f"{hasher.hexdigest()}{file_extension}"
+            )
+            os.replace(tmp_path, file_path)
+        except Exception:
+            # Aborted stream or failed rename: don't orphan the partial
+            # temp file in the upload dir.
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        shm_name, shm_size = (None, 0)
+        if keep_copy and buffered:
+            shm_name, shm_size = _share_upload_bytes(buffered)
+
+        return file_path, shm_name, shm_size
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File save failed: {str(e)}")
@@ -59,12 +133,43 @@ async def analyze_document(
     """
     try:
         # Save file locally
-        file_path = await save_upload_file(file)
-
-        # Send job to Celery worker
-        task = process_document.delay(file_path, query)
-
-        return JSONResponse(
+        file_path, shm_name, shm_size = await save_upload_file(file)
+
+        try:
+            # Same document + same query already analyzed? Return the
+            # stored result instead of paying for another parse and
+            # Crew run.
+            db = SessionLocal()
+            try:
+                existing = (
+                    db.query(AnalysisResult)
+                    .filter_by(filename=file_path, query=query)
+                    .first()
+                )
+            finally:
+                db.close()
+
+            if existing is not None:
+                # No worker will consume the shared bytes; release them.
+                _discard_shared_bytes(shm_name)
+                return ORJSONResponse(
+                    content={
+                        "status": "completed",
+                        "result": existing.result,
+                        "message": "Returned cached analysis for identical upload",
+                        "file_path": file_path,
+                    }
+                )
+
+            # Send job to Celery worker
+            task = process_document.delay(file_path, query, shm_name, shm_size)
+        except Exception:
+            # Enqueue (or the dedupe lookup) failed, so no worker will
+            # ever attach to the segment; release it before failing.
+            _discard_shared_bytes(shm_name)
+            raise
+
+        return ORJSONResponse(
             content={
                 "status": "processing",
                 "task_id": task.id,
@@ -85,6 +190,15 @@ def get_status(task_id: str):
     """
     Check background task status.
     """
+    # Hot path: finished analyses live in Redis, no SQLite round trip.
+    raw = redis_client.get(f"analysis:{task_id}")
+    if raw is not None:
+        record = json.loads(raw)
+        return {
+            "status": "completed",
+            "result": record["result"],
+        }
+
     task_result = AsyncResult(task_id, app=celery_app)
 
     if task_result.state == "PENDING":
@@ -117,9 +231,22 @@ def root():
 # Local run
 # =========================
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
+    run_kwargs = dict(
         host="0.0.0.0",
         port=8000,
         reload=False,  # Windows-stable
-    )
\ No newline at end of file
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )
+
+    # uvloop + httptools cut per-byte overhead on large uploads
+    # dramatically; fall back to asyncio defaults where unavailable
+    # (uvloop does not support Windows).
+    try:
+        import uvloop  # noqa: F401
+        import httptools  # noqa: F401
+
+        run_kwargs.update(loop="uvloop", http="httptools")
+    except ImportError:
+        pass
+
+    uvicorn.run("main:app", **run_kwargs)
\ No newline at end of file
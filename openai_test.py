@@ -1,22 +1,32 @@
-from dotenv import load_dotenv
+import asyncio
 import os
-from openai import OpenAI
 
-load_dotenv(override=True)
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
 
-api_key = os.getenv("OPENAI_API_KEY").strip()
-org_id = os.getenv("OPENAI_ORG_ID").strip()
-project_id = os.getenv("OPENAI_PROJECT_ID").strip()
+load_dotenv(override=True)
 
-client = OpenAI(
-    api_key=api_key,
-    organization=org_id,
-    project=project_id,
+# Shared async client: the HTTPS connection pool (and its TLS handshakes)
+# is set up once and reused, so importing this module never issues a
+# blocking request and concurrent LLM calls share connections.
+client = AsyncOpenAI(
+    api_key=(os.getenv("OPENAI_API_KEY") or "").strip(),
+    organization=(os.getenv("OPENAI_ORG_ID") or "").strip() or None,
+    project=(os.getenv("OPENAI_PROJECT_ID") or "").strip() or None,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    ),
 )
 
-response = client.responses.create(
-    model="gpt-4.1-mini",
-    input="Say API working"
-)
 
-print(response.output_text)
\ No newline at end of file
+async def smoke_test() -> str:
+    response = await client.responses.create(
+        model="gpt-4.1-mini",
+        input="Say API working",
+    )
+    return response.output_text
+
+
+if __name__ == "__main__":
+    print(asyncio.run(smoke_test()))
@@ -2,38 +2,74 @@ from crewai import Task
 from agents import financial_analyst, verifier
 from tools import FinancialDocumentTool
 
-# =========================
-# Task 1: Analyze
-# =========================
-analyze_financial_document = Task(
-    description=(
-    "Use the financial_document_reader tool to read the PDF at {path}.\n\n"
+# Built once at import; CrewAI snapshots each description on the first
+# kickoff and re-substitutes {path}/{query} per run, so the static text
+# is never re-assembled on the hot path.
+_STRICT_RULES = (
     "STRICT INSTRUCTIONS:\n"
     "- Base your answer ONLY on the document\n"
-    "You MUST use the financial_document_reader tool before answering\n"
+    "- You MUST use the financial_document_reader tool before answering\n"
     "- Do NOT assume missing data\n"
     "- If information is missing, say 'Not found in document'\n"
     "- Quote exact numbers when available\n\n"
-    "Then answer the user's query: {query}.\n\n"
-    "Output must include:\n"
-    "1. Key financial metrics (with values)\n"
-    "2. Risks (document-backed only)\n"
-    "3. Opportunities (document-backed only)\n"
-    "4. Final summary"
-),
-    expected_output="Structured financial analysis report.",
+)
+
+# =========================
+# Analysis sub-tasks
+# =========================
+# Split into three sections that run concurrently (async_execution), so
+# their LLM round trips overlap instead of running back to back.
+extract_financial_metrics = Task(
+    description=(
+        "Use the financial_document_reader tool to read the PDF at {path}.\n\n"
+        + _STRICT_RULES
+        + "Focusing on the user's query ({query}), list the key financial "
+        "metrics with their exact values."
+    ),
+    expected_output="Key financial metrics with values.",
     agent=financial_analyst,
     tools=[FinancialDocumentTool()],
-    async_execution=False,
+    async_execution=True,
+)
+
+identify_risks = Task(
+    description=(
+        "Use the financial_document_reader tool to read the PDF at {path}.\n\n"
+        + _STRICT_RULES
+        + "Focusing on the user's query ({query}), list the risks that are "
+        "backed by the document."
+    ),
+    expected_output="Document-backed risks.",
+    agent=financial_analyst,
+    tools=[FinancialDocumentTool()],
+    async_execution=True,
+)
+
+identify_opportunities = Task(
+    description=(
+        "Use the financial_document_reader tool to read the PDF at {path}.\n\n"
+        + _STRICT_RULES
+        + "Focusing on the user's query ({query}), list the opportunities "
+        "that are backed by the document."
+    ),
+    expected_output="Document-backed opportunities.",
+    agent=financial_analyst,
+    tools=[FinancialDocumentTool()],
+    async_execution=True,
 )
+
 # =========================
-# Task 2: Verify
+# Verify & join
 # =========================
 verify_financial_analysis = Task(
     description=(
-        "Review the previous financial analysis for accuracy and logical consistency."
+        "Combine the metrics, risks, and opportunities sections into one "
+        "report answering the user's query: {query}. Review it for accuracy "
+        "and logical consistency, keep only document-backed statements, and "
+        "end with a final summary."
     ),
     expected_output="Verified and improved financial analysis.",
     agent=verifier,
+    context=[extract_financial_metrics, identify_risks, identify_opportunities],
     async_execution=False,
-)
\ No newline at end of file
+)
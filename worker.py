@@ -1,19 +1,178 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+import redis
+from openai import OpenAI
+
 from celery_app import celery_app
 from crewai import Crew, Process
-from agents import financial_analyst, verifier
-from task import analyze_financial_document, verify_financial_analysis
-from database import SessionLocal, AnalysisResult
+from agents import financial_analyst, verifier, llm
+from task import (
+    extract_financial_metrics,
+    identify_risks,
+    identify_opportunities,
+    verify_financial_analysis,
+)
+from database import Session, AnalysisResult
+from tools import prime_text_cache
 
+# The three analysis sub-tasks run concurrently (async_execution) and the
+# verifier joins them, so LLM latency overlaps instead of stacking.
 financial_crew = Crew(
     agents=[financial_analyst, verifier],
-    tasks=[analyze_financial_document, verify_financial_analysis],
-    process=Process.sequential,
+    tasks=[
+        extract_financial_metrics,
+        identify_risks,
+        identify_opportunities,
+        verify_financial_analysis,
+    ],
+    process=Process.hierarchical,
+    manager_llm=llm,
     verbose=True,
 )
 
+# =========================
+# LLM response cache
+# =========================
+# Two tiers, both kept in the Redis already running for Celery:
+#   1. exact match on sha256(file bytes) + query + prompt version
+#   2. semantic match: embed the query and compare against recent
+#      queries for the same document (cosine similarity >= threshold)
+# A hit skips the multi-second Crew/LLM call entirely.
+PROMPT_VERSION = "v1"
+CACHE_TTL = 7 * 24 * 3600  # 7 days
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_INDEX_SIZE = 256  # recent queries kept per document
+
+redis_client = redis.Redis.from_url("redis://localhost:6379/0")
+openai_client = OpenAI()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _embed_query(query: str) -> np.ndarray:
+    response = openai_client.embeddings.create(
+        model="text-embedding-3-small",
+        input=query,
+    )
+    return np.array(response.data[0].embedding, dtype=np.float32)
+
+
+def _semantic_lookup(content_hash: str, query_vec: np.ndarray):
+    entries = redis_client.lrange(
+        f"analysis_embeddings:{content_hash}", 0, SEMANTIC_INDEX_SIZE - 1
+    )
+    for raw in entries:
+        entry = json.loads(raw)
+        vec = np.array(entry["embedding"], dtype=np.float32)
+        sim = float(
+            np.dot(query_vec, vec)
+            / (np.linalg.norm(query_vec) * np.linalg.norm(vec))
+        )
+        if sim >= SEMANTIC_THRESHOLD:
+            cached = redis_client.get(entry["key"])
+            if cached is not None:
+                return cached.decode()
+    return None
+
+
+def _store_in_cache(content_hash: str, cache_key: str, result: str, query_vec):
+    redis_client.set(cache_key, result, ex=CACHE_TTL)
+    if query_vec is not None:
+        index_key = f"analysis_embeddings:{content_hash}"
+        redis_client.lpush(
+            index_key,
+            json.dumps({"embedding": query_vec.tolist(), "key": cache_key}),
+        )
+        redis_client.ltrim(index_key, 0, SEMANTIC_INDEX_SIZE - 1)
+        redis_client.expire(index_key, CACHE_TTL)
+
+
+def _publish_result(task_id: str, file_path: str, query: str, result: str,
+                    archive: bool = True):
+    """Write the finished analysis to Redis for the status endpoint.
+
+    Redis is the hot path; SQLite is only an offline archive filled by
+    the periodic archive_results task, so nothing on the request path
+    waits on a filesystem lock.
+    """
+    payload = json.dumps(
+        {
+            "filename": file_path,
+            "query": query,
+            "result": result,
+            "created_at": time.time(),
+        }
+    )
+    # Expire like the response cache; /status falls back to the Celery
+    # result backend and the SQLite archive keeps the permanent copy.
+    redis_client.set(f"analysis:{task_id}", payload, ex=CACHE_TTL)
+    if archive:
+        redis_client.rpush("analysis_archive_queue", payload)
+
+
+def _consume_shared_bytes(shm_name, shm_size):
+    """Attach to the upload bytes published by /analyze and free them."""
+    if not shm_name:
+        return None
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        data = bytes(shm.buf[:shm_size])
+        shm.close()
+        shm.unlink()
+        return data
+    except Exception:
+        return None
+
+
+@celery_app.task(name="worker.process_document", bind=True)
+def process_document(self, file_path: str, query: str,
+                     shm_name: str = None, shm_size: int = 0):
+    # When the upload arrived through shared memory, hash the in-memory
+    # bytes and prime the extraction cache from them, skipping the
+    # second full read of the file from disk.
+    file_bytes = _consume_shared_bytes(shm_name, shm_size)
+    if file_bytes is not None:
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        try:
+            prime_text_cache(content_hash, file_bytes)
+        except Exception:
+            pass
+    else:
+        content_hash = _file_sha256(file_path)
+    cache_key = f"analysis_cache:{content_hash}:{query}:{PROMPT_VERSION}"
+
+    # Tier 1: exact match
+    cached = redis_client.get(cache_key)
+    if cached is not None:
+        result = cached.decode()
+        _publish_result(self.request.id, file_path, query, result, archive=False)
+        return result
+
+    # Tier 2: semantic match. The cache must never take a task down,
+    # so embedding/lookup failures fall through to a normal run.
+    query_vec = None
+    try:
+        query_vec = _embed_query(query)
+        semantic_hit = _semantic_lookup(content_hash, query_vec)
+        if semantic_hit is not None:
+            _publish_result(
+                self.request.id, file_path, query, semantic_hit, archive=False
+            )
+            return semantic_hit
+    except Exception:
+        pass
 
-@celery_app.task(name="worker.process_document")
-def process_document(file_path: str, query: str):
     # Run Crew
     result = financial_crew.kickoff(
         inputs={
@@ -22,15 +181,51 @@ def process_document(file_path: str, query: str):
         }
     )
 
-    # Save to DB
-    db = SessionLocal()
-    record = AnalysisResult(
-        filename=file_path,
-        query=query,
-        result=str(result),
+    try:
+        _store_in_cache(content_hash, cache_key, str(result), query_vec)
+    except Exception:
+        pass
+
+    _publish_result(self.request.id, file_path, query, str(result))
+
+    return str(result)
+
+
+@celery_app.task(name="worker.archive_results")
+def archive_results(batch_size: int = 500):
+    """Drain finished analyses from Redis into SQLite in one commit.
+
+    The queue is only trimmed after the commit succeeds, so a failed or
+    interrupted batch stays in Redis and is retried on the next beat
+    tick instead of being lost.
+    """
+    raw_entries = redis_client.lrange(
+        "analysis_archive_queue", 0, batch_size - 1
     )
-    db.add(record)
-    db.commit()
-    db.close()
+    if not raw_entries:
+        return 0
+
+    rows = []
+    for raw in raw_entries:
+        entry = json.loads(raw)
+        rows.append(
+            AnalysisResult(
+                filename=entry["filename"],
+                query=entry["query"],
+                result=entry["result"],
+                created_at=datetime.utcfromtimestamp(entry["created_at"]),
+            )
+        )
+
+    try:
+        Session.add_all(rows)
+        Session.commit()
+    except Exception:
+        Session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+    redis_client.ltrim("analysis_archive_queue", len(raw_entries), -1)
 
-    return str(result)
\ No newline at end of file
+    return len(raw_entries)